@@ -4,15 +4,43 @@ Script de collecte des données des codes législatifs français
 depuis l'API Forgejo de git.tricoteuses.fr
 """
 
+import http.client
 import json
 import time
 import sys
-from datetime import datetime
-from typing import List, Dict, Optional
-import urllib.request
-import urllib.error
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, List, Dict, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit
 from pathlib import Path
 
+try:
+    import orjson  # Optionnel: (dé)sérialisation JSON plus rapide
+except ImportError:
+    orjson = None
+
+# Nombre de dépôts récupérés simultanément
+MAX_WORKERS = 8
+
+# Taille des pages demandées à l'API (le serveur peut la plafonner, à 50 par défaut)
+REPOS_PAGE_SIZE = 50
+COMMITS_PAGE_SIZE = 100
+
+# Longueur des hash courts conservés pour chaque commit
+SHORT_SHA_LENGTH = 12
+
+# Redirections suivies par le client (dépôt renommé ou déplacé, par exemple)
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+# Depuis Python 3.11, fromisoformat accepte directement le suffixe 'Z'
+if sys.version_info >= (3, 11):
+    parse_iso_datetime = datetime.fromisoformat
+else:
+    def parse_iso_datetime(date_str: str) -> datetime:
+        return datetime.fromisoformat(date_str.replace('Z', '+00:00'))
+
 
 class ForgejoAPIClient:
     """Client pour l'API Forgejo de git.tricoteuses.fr"""
@@ -22,69 +50,187 @@ class ForgejoAPIClient:
     def __init__(self, rate_limit_delay: float = 0.3):
         self.rate_limit_delay = rate_limit_delay
         self.request_count = 0
+        # Une connexion keep-alive par thread (http.client n'est pas thread-safe)
+        self._local = threading.local()
+        # Le rate limit est global: les threads se partagent la même cadence
+        self._lock = threading.Lock()
+        self._next_request_at = 0.0
+
+    def _get_connection(self, scheme: str, host: str) -> http.client.HTTPConnection:
+        """Retourne la connexion persistante (keep-alive) du thread courant vers l'hôte de l'API"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.connection_key != (scheme, host):
+            self._close_connection()
+            if scheme == 'https':
+                connection = http.client.HTTPSConnection(host, timeout=30)
+            else:
+                connection = http.client.HTTPConnection(host, timeout=30)
+            self._local.connection = connection
+            self._local.connection_key = (scheme, host)
+        return connection
+
+    def _close_connection(self):
+        """Ferme la connexion du thread courant (elle sera rouverte à la prochaine requête)"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def _wait_rate_limit(self):
+        """Espace les requêtes de tous les threads d'au moins rate_limit_delay secondes"""
+        with self._lock:
+            self.request_count += 1
+            now = time.monotonic()
+            start_at = max(now, self._next_request_at)
+            self._next_request_at = start_at + self.rate_limit_delay
+        if start_at > now:
+            time.sleep(start_at - now)
+
+    def _send_request(self, url: str, headers: Optional[Dict[str, str]] = None,
+                      retries: int = 3, redirects: int = MAX_REDIRECTS) -> Optional[Tuple[int, Any, http.client.HTTPMessage]]:
+        """
+        Effectue une requête HTTP avec retry, en réutilisant la même connexion TCP/TLS.
+        Les redirections sont suivies (au plus `redirects`), comme le faisait urllib.
+        Retourne (statut, données JSON, en-têtes), avec des données à None pour 304 et 404.
+        """
+        parts = urlsplit(url)
+        path = f"{parts.path}?{parts.query}" if parts.query else parts.path
+        request_headers = {'Accept': 'application/json', **(headers or {})}
 
-    def _make_request(self, url: str, retries: int = 3) -> Optional[Dict]:
-        """Effectue une requête HTTP avec retry"""
         for attempt in range(retries):
             try:
-                self.request_count += 1
-                with urllib.request.urlopen(url, timeout=30) as response:
-                    data = json.loads(response.read().decode())
-                    time.sleep(self.rate_limit_delay)
-                    return data
-            except urllib.error.HTTPError as e:
-                if e.code == 404:
+                self._wait_rate_limit()
+                connection = self._get_connection(parts.scheme, parts.netloc)
+                connection.request('GET', path, headers=request_headers)
+                response = connection.getresponse()
+                # Lire la réponse en entier pour pouvoir réutiliser la connexion
+                body = response.read()
+
+                if response.status in (304, 404):
+                    return response.status, None, response.headers
+                if response.status in REDIRECT_STATUSES:
+                    location = response.headers.get('Location')
+                    if location and redirects > 0:
+                        return self._send_request(urljoin(url, location), headers, retries, redirects - 1)
+                    print(f"  ⚠️  Redirection {response.status} non suivie pour {url}")
                     return None
-                print(f"  ⚠️  HTTP Error {e.code} pour {url}, tentative {attempt + 1}/{retries}")
-                if attempt < retries - 1:
-                    time.sleep(2 ** attempt)  # Exponential backoff
+                if response.status >= 400:
+                    print(f"  ⚠️  HTTP Error {response.status} pour {url}, tentative {attempt + 1}/{retries}")
+                    if attempt < retries - 1:
+                        time.sleep(2 ** attempt)  # Exponential backoff
+                    continue
+
+                return response.status, json.loads(body.decode()), response.headers
             except Exception as e:
+                # Connexion probablement fermée par le serveur: repartir d'une connexion neuve
+                self._close_connection()
                 print(f"  ⚠️  Erreur: {e}, tentative {attempt + 1}/{retries}")
                 if attempt < retries - 1:
                     time.sleep(2 ** attempt)
         return None
 
+    @staticmethod
+    def _is_last_page(items: List, fetched: int, total_count: Optional[int], page_size: int) -> bool:
+        """
+        Indique si la page reçue est la dernière: tous les éléments annoncés par
+        X-Total-Count sont reçus, ou la page est plus courte que la première.
+        La taille de page de référence est celle réellement renvoyée par le serveur,
+        qui peut plafonner le paramètre `limit`.
+        """
+        if total_count is not None:
+            return fetched >= total_count
+        return len(items) < page_size
+
     def fetch_all_repos(self) -> List[Dict]:
         """Récupère la liste de tous les dépôts de l'organisation 'codes'"""
         print("📚 Récupération de la liste des dépôts...")
         all_repos = []
         page = 1
+        total_count = None
+        page_size = 0
 
         while True:
-            url = f"{self.BASE_URL}/orgs/codes/repos?limit=50&page={page}"
-            repos = self._make_request(url)
+            url = f"{self.BASE_URL}/orgs/codes/repos?limit={REPOS_PAGE_SIZE}&page={page}"
+            result = self._send_request(url)
+            repos = result[1] if result else None
 
             if not repos:
                 break
 
+            if page == 1:
+                header = result[2].get('X-Total-Count')
+                total_count = int(header) if header is not None else None
+                page_size = len(repos)
+
             all_repos.extend(repos)
             print(f"  → Page {page}: {len(repos)} dépôts")
+
+            if self._is_last_page(repos, len(all_repos), total_count, page_size):
+                break
             page += 1
 
         print(f"✅ {len(all_repos)} codes législatifs trouvés\n")
         return all_repos
 
-    def fetch_repo_commits(self, repo_name: str) -> List[Dict]:
-        """Récupère tous les commits d'un dépôt"""
+    def fetch_repo_commits(self, repo_name: str, known_shas: Optional[Set[str]] = None,
+                           etag: Optional[str] = None) -> Tuple[Optional[List[Dict]], Optional[str], bool, bool]:
+        """
+        Récupère les commits d'un dépôt. L'API les liste dans l'ordre de l'historique,
+        les plus récents d'abord: si `known_shas` (hash courts déjà collectés) est fourni,
+        la pagination s'arrête à la première page contenant un commit connu.
+        Retourne (commits, ETag de la première page, collecte complète, commit connu
+        atteint); commits vaut None si le serveur répond 304 Not Modified à l'ETag
+        fourni. La collecte est incomplète si une page n'a pas pu être récupérée
+        malgré les tentatives. Une collecte complète qui n'a atteint aucun commit
+        connu contient tout l'historique du dépôt.
+        """
         all_commits = []
         page = 1
+        total_count = None
+        page_size = 0
+        new_etag = None
 
         while True:
-            url = f"{self.BASE_URL}/repos/codes/{repo_name}/commits?limit=100&page={page}"
-            commits = self._make_request(url)
+            url = f"{self.BASE_URL}/repos/codes/{repo_name}/commits?limit={COMMITS_PAGE_SIZE}&page={page}"
+            headers = {'If-None-Match': etag} if page == 1 and etag else None
+            result = self._send_request(url, headers=headers)
+
+            if result is None:
+                return all_commits, new_etag, False, False
+
+            status, commits, response_headers = result
+            if page == 1:
+                if status == 304:
+                    return None, etag, True, True
+                new_etag = response_headers.get('ETag')
+                # Le nombre total de commits permet d'arrêter la pagination sans page vide
+                header = response_headers.get('X-Total-Count')
+                total_count = int(header) if header is not None else None
+                page_size = len(commits) if commits else 0
 
             if not commits:
                 break
 
             all_commits.extend(commits)
+
+            # Les pages suivantes ne contiennent que des commits déjà collectés
+            if known_shas and any(c['sha'][:SHORT_SHA_LENGTH] in known_shas for c in commits):
+                return all_commits, new_etag, True, True
+            if self._is_last_page(commits, len(all_commits), total_count, page_size):
+                break
             page += 1
 
-        return all_commits
+        return all_commits, new_etag, True, False
 
 
 class DataProcessor:
     """Transforme les données de l'API en format optimisé pour la visualisation"""
 
+    @staticmethod
+    def parse_timestamp(date_str: str) -> int:
+        """Convertit une date ISO 8601 en timestamp en millisecondes"""
+        return int(parse_iso_datetime(date_str).timestamp() * 1000)
+
     @staticmethod
     def extract_commit_data(commit: Dict, repo_slug: str) -> Dict:
         """Extrait les données pertinentes d'un commit"""
@@ -98,8 +244,7 @@ class DataProcessor:
 
         # Parser la date et créer un timestamp
         date_str = commit['commit']['author']['date']
-        dt = datetime.fromisoformat(date_str.replace('Z', '+00:00'))
-        timestamp = int(dt.timestamp() * 1000)  # Timestamp en millisecondes
+        timestamp = DataProcessor.parse_timestamp(date_str)  # Timestamp en millisecondes
 
         # Récupérer les stats (additions/deletions)
         stats = commit.get('stats', {})
@@ -107,7 +252,7 @@ class DataProcessor:
         deletions = stats.get('deletions', 0)
 
         return {
-            'sha': commit['sha'][:12],  # Hash court
+            'sha': commit['sha'][:SHORT_SHA_LENGTH],  # Hash court
             'date': date_str,
             'ts': timestamp,
             'msg': title,
@@ -117,36 +262,58 @@ class DataProcessor:
         }
 
     @staticmethod
-    def process_all_data(repos: List[Dict], commits_by_repo: Dict[str, List[Dict]]) -> Dict:
-        """Traite toutes les données et calcule les métadonnées globales"""
+    def extract_repo_commits(commits: List[Dict], repo_slug: str) -> List[Dict]:
+        """Extrait les données pertinentes de chaque commit brut renvoyé par l'API"""
+        processed_commits = []
+        for commit in commits:
+            try:
+                processed_commits.append(DataProcessor.extract_commit_data(commit, repo_slug))
+            except Exception as e:
+                print(f"  ⚠️  Erreur lors du traitement d'un commit: {e}")
+        return processed_commits
+
+    @staticmethod
+    def process_all_data(repos: List[Dict], commits_by_repo: Dict[str, List[Dict]],
+                         cached_commits: Optional[Dict[str, List[Dict]]] = None,
+                         full_history_repos: Optional[Set[str]] = None) -> Dict:
+        """
+        Traite toutes les données et calcule les métadonnées globales.
+        commits_by_repo contient les nouveaux commits, déjà extraits par
+        extract_repo_commits. Les commits d'une collecte précédente (cached_commits,
+        par dépôt) sont conservés et fusionnés avec les nouveaux commits, sauf pour
+        les dépôts de full_history_repos: leur historique complet vient d'être
+        récupéré (il a pu être réécrit) et remplace celui en cache.
+        """
         all_timestamps = []
         max_additions = 0
         max_deletions = 0
         total_commits = 0
 
         codes_data = []
+        cached_commits = cached_commits or {}
+        full_history_repos = full_history_repos or set()
 
         for repo in repos:
             repo_name = repo['name']
             repo_commits = commits_by_repo.get(repo_name, [])
+            previous_commits = [] if repo_name in full_history_repos else cached_commits.get(repo_name, [])
 
-            if not repo_commits:
+            if not repo_commits and not previous_commits:
                 continue
 
-            # Traiter chaque commit
-            processed_commits = []
-            for commit in repo_commits:
-                try:
-                    commit_data = DataProcessor.extract_commit_data(commit, repo_name)
+            # Ajouter chaque nouveau commit (ceux déjà en cache sont ignorés)
+            processed_commits = list(previous_commits)
+            known_shas = {c['sha'] for c in processed_commits}
+            for commit_data in repo_commits:
+                if commit_data['sha'] not in known_shas:
+                    known_shas.add(commit_data['sha'])
                     processed_commits.append(commit_data)
 
-                    # Mettre à jour les statistiques globales
-                    all_timestamps.append(commit_data['ts'])
-                    max_additions = max(max_additions, commit_data['add'])
-                    max_deletions = max(max_deletions, commit_data['del'])
-                except Exception as e:
-                    print(f"  ⚠️  Erreur lors du traitement d'un commit: {e}")
-                    continue
+            # Mettre à jour les statistiques globales
+            for commit_data in processed_commits:
+                all_timestamps.append(commit_data['ts'])
+                max_additions = max(max_additions, commit_data['add'])
+                max_deletions = max(max_deletions, commit_data['del'])
 
             # Trier les commits par timestamp (ordre chronologique)
             processed_commits.sort(key=lambda c: c['ts'])
@@ -163,7 +330,7 @@ class DataProcessor:
 
         # Calculer les métadonnées globales
         metadata = {
-            'generated_at': datetime.utcnow().isoformat() + 'Z',
+            'generated_at': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
             'total_codes': len(codes_data),
             'total_commits': total_commits,
             'earliest_commit': min(all_timestamps) if all_timestamps else 0,
@@ -181,6 +348,39 @@ class DataProcessor:
         }
 
 
+def read_json(path: Path):
+    """Lit un fichier JSON (avec orjson si disponible)"""
+    if orjson is not None:
+        return orjson.loads(path.read_bytes())
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_json(path: Path, data):
+    """Écrit un fichier JSON compact en UTF-8 (avec orjson si disponible)"""
+    if orjson is not None:
+        path.write_bytes(orjson.dumps(data))
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def load_fetch_state(state_file: Path) -> Dict[str, Dict]:
+    """Charge l'état de la collecte précédente (ETag de la première page, par dépôt)"""
+    if not state_file.exists():
+        return {}
+    with open(state_file, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def load_cached_commits(data_file: Path) -> Dict[str, List[Dict]]:
+    """Charge les commits déjà traités lors de la collecte précédente, par dépôt"""
+    if not data_file.exists():
+        return {}
+    data = read_json(data_file)
+    return {code['slug']: code['commits'] for code in data['codes']}
+
+
 def main():
     """Fonction principale"""
     print("=" * 60)
@@ -188,6 +388,21 @@ def main():
     print("=" * 60)
     print()
 
+    output_dir = Path(__file__).parent.parent / 'docs' / 'data'
+    output_dir.mkdir(parents=True, exist_ok=True)
+    output_file = output_dir / 'codes_data.json'
+    state_file = output_dir / '.fetch_state.json'
+
+    # Collecte incrémentale: ne récupérer que les commits publiés depuis la
+    # collecte précédente (passer --full pour tout récupérer à nouveau)
+    if '--full' in sys.argv:
+        fetch_state, cached_commits = {}, {}
+    else:
+        fetch_state = load_fetch_state(state_file)
+        cached_commits = load_cached_commits(output_file) if fetch_state else {}
+        if cached_commits:
+            print(f"♻️  Collecte incrémentale à partir de {output_file.name}\n")
+
     # Initialiser le client API
     client = ForgejoAPIClient(rate_limit_delay=0.3)
 
@@ -203,38 +418,79 @@ def main():
     # repos = repos[:5]
     # print(f"⚠️  Mode test: limité à {len(repos)} codes\n")
 
-    # Récupérer les commits pour chaque dépôt
+    def fetch_new_commits(repo_name: str) -> Tuple[Optional[List[Dict]], Optional[str], bool, bool]:
+        """
+        Récupère les commits d'un dépôt publiés depuis la dernière collecte et les
+        extrait aussitôt, pour ne pas garder en mémoire les réponses brutes de l'API.
+        Les commits déjà connus servent de curseur: la date d'auteur est la date
+        d'effet du texte, pas celle de publication, et ne convient donc pas.
+        """
+        # Sans état (première collecte, ou collecte précédente incomplète), tout récupérer
+        if repo_name in fetch_state and repo_name in cached_commits:
+            known_shas = {c['sha'] for c in cached_commits[repo_name]}
+            etag = fetch_state[repo_name].get('etag')
+        else:
+            known_shas, etag = None, None
+        commits, new_etag, complete, reached_known = client.fetch_repo_commits(repo_name, known_shas=known_shas, etag=etag)
+        if commits is not None:
+            commits = DataProcessor.extract_repo_commits(commits, repo_name)
+        return commits, new_etag, complete, reached_known
+
+    # Récupérer les commits de plusieurs dépôts en parallèle
     print("📥 Récupération des commits...")
     commits_by_repo = {}
+    etags_by_repo = {}
+    incomplete_repos = set()
+    full_history_repos = set()
 
-    for i, repo in enumerate(repos, 1):
-        repo_name = repo['name']
-        print(f"  [{i}/{len(repos)}] {repo.get('description', repo_name)}...", end=' ')
-
-        commits = client.fetch_repo_commits(repo_name)
-        commits_by_repo[repo_name] = commits
-
-        print(f"✓ {len(commits)} commits")
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        futures = {executor.submit(fetch_new_commits, repo['name']): repo for repo in repos}
 
-    print(f"\n✅ {sum(len(c) for c in commits_by_repo.values())} commits au total")
+        for i, future in enumerate(as_completed(futures), 1):
+            repo = futures[future]
+            repo_name = repo['name']
+            commits, etag, complete, reached_known = future.result()
+            etags_by_repo[repo_name] = etag
+
+            if commits is None:
+                commits_by_repo[repo_name] = []
+                print(f"  [{i}/{len(repos)}] {repo.get('description', repo_name)}... ✓ inchangé")
+            elif not complete:
+                incomplete_repos.add(repo_name)
+                commits_by_repo[repo_name] = commits
+                print(f"  [{i}/{len(repos)}] {repo.get('description', repo_name)}... ⚠️  incomplet ({len(commits)} commits)")
+            else:
+                # Aucun commit connu atteint: c'est tout l'historique (éventuellement réécrit)
+                if not reached_known:
+                    full_history_repos.add(repo_name)
+                commits_by_repo[repo_name] = commits
+                print(f"  [{i}/{len(repos)}] {repo.get('description', repo_name)}... ✓ {len(commits)} commits")
+
+    print(f"\n✅ {sum(len(c) for c in commits_by_repo.values())} commits récupérés")
     print(f"📊 {client.request_count} requêtes API effectuées\n")
 
     # Traiter les données
     print("⚙️  Traitement des données...")
-    final_data = DataProcessor.process_all_data(repos, commits_by_repo)
+    final_data = DataProcessor.process_all_data(repos, commits_by_repo, cached_commits, full_history_repos)
 
     print(f"✅ {final_data['metadata']['total_commits']} commits traités")
     print(f"📊 Max additions: {final_data['metadata']['max_additions']}")
     print(f"📊 Max deletions: {final_data['metadata']['max_deletions']}\n")
 
     # Sauvegarder le fichier JSON
-    output_dir = Path(__file__).parent.parent / 'docs' / 'data'
-    output_dir.mkdir(parents=True, exist_ok=True)
-    output_file = output_dir / 'codes_data.json'
-
     print(f"💾 Sauvegarde dans {output_file}...")
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(final_data, f, ensure_ascii=False, separators=(',', ':'))
+    write_json(output_file, final_data)
+
+    # Sauvegarder l'état de la collecte pour la prochaine exécution.
+    # Un dépôt collecté partiellement n'a pas d'état: il sera récupéré en entier
+    # la prochaine fois (ses commits déjà connus ne garantissent rien sur les autres)
+    new_state = {}
+    for code in final_data['codes']:
+        if code['slug'] in incomplete_repos:
+            continue
+        new_state[code['slug']] = {'etag': etags_by_repo.get(code['slug'])}
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(new_state, f, ensure_ascii=False, indent=1, sort_keys=True)
 
     # Afficher la taille du fichier
     file_size = output_file.stat().st_size
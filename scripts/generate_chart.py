@@ -6,14 +6,24 @@ Produit: index.html (page autonome, pas de SVG)
 """
 
 import json
+import math
 from datetime import datetime
 from collections import defaultdict
+from itertools import accumulate, groupby
+from operator import itemgetter
 from pathlib import Path
-from html import escape
+from typing import TextIO
+
+try:
+    import orjson  # Optionnel: lecture JSON plus rapide
+except ImportError:
+    orjson = None
 
 
 def load_data(data_file: Path) -> dict:
     """Charge les données JSON"""
+    if orjson is not None:
+        return orjson.loads(data_file.read_bytes())
     with open(data_file, 'r', encoding='utf-8') as f:
         return json.load(f)
 
@@ -23,48 +33,70 @@ def aggregate_by_year(data: dict) -> list:
     Agrège tous les commits de tous les codes par année.
     Retourne une liste de dicts avec les totaux et les détails par code.
     """
-    yearly = defaultdict(lambda: {
-        'add': 0,
-        'del': 0,
-        'codes': defaultdict(lambda: {'add': 0, 'del': 0, 'commits': 0})
-    })
+    # Accumulateurs à plat: [add, del] par année et [add, del, commits] par (année, code)
+    year_totals = defaultdict(lambda: [0, 0])
+    code_totals = {}
+
+    # Beaucoup de commits partagent le même timestamp: ne convertir chacun qu'une fois
+    year_cache = {}
+
+    def commit_year(commit: dict) -> int:
+        ts = commit['ts']
+        year = year_cache.get(ts)
+        if year is None:
+            year = year_cache[ts] = datetime.fromtimestamp(ts / 1000).year
+        return year
 
     for code in data['codes']:
         code_name = code['name']
 
-        for commit in code['commits']:
-            ts = commit['ts']
-            dt = datetime.fromtimestamp(ts / 1000)
-            year = dt.year
-
-            yearly[year]['add'] += commit['add']
-            yearly[year]['del'] += commit['del']
-            yearly[year]['codes'][code_name]['add'] += commit['add']
-            yearly[year]['codes'][code_name]['del'] += commit['del']
-            yearly[year]['codes'][code_name]['commits'] += 1
+        # Les commits sont triés par date: ceux d'une même année sont contigus,
+        # on somme chaque groupe d'un bloc plutôt que commit par commit
+        for year, group in groupby(code['commits'], key=commit_year):
+            group = list(group)
+            add = sum(c['add'] for c in group)
+            dele = sum(c['del'] for c in group)
+
+            totals = year_totals[year]
+            totals[0] += add
+            totals[1] += dele
+
+            key = (year, code_name)
+            code_total = code_totals.get(key)
+            if code_total is None:
+                code_totals[key] = [add, dele, len(group)]
+            else:
+                code_total[0] += add
+                code_total[1] += dele
+                code_total[2] += len(group)
+
+    # Regrouper les totaux par code sous leur année
+    codes_by_year = defaultdict(list)
+    for (year, code_name), (add, dele, commits) in code_totals.items():
+        codes_by_year[year].append({
+            'name': code_name,
+            'add': add,
+            'del': dele,
+            'net': add - dele,
+            'commits': commits
+        })
 
     # Convertir en liste triée
     result = []
-    for year in sorted(yearly.keys()):
+    for year in sorted(year_totals.keys()):
+        add, dele = year_totals[year]
+
         # Trier les codes par nombre de modifications (desc)
-        codes_list = []
-        for code_name, code_data in yearly[year]['codes'].items():
-            codes_list.append({
-                'name': code_name,
-                'add': code_data['add'],
-                'del': code_data['del'],
-                'commits': code_data['commits']
-            })
-        codes_list.sort(key=lambda c: c['add'] - c['del'], reverse=True)
+        codes_list = codes_by_year[year]
+        codes_list.sort(key=itemgetter('net'), reverse=True)
 
         total_commits = sum(c['commits'] for c in codes_list)
-        net = yearly[year]['add'] - yearly[year]['del']
 
         result.append({
             'year': year,
-            'add': yearly[year]['add'],
-            'del': yearly[year]['del'],
-            'net': net,
+            'add': add,
+            'del': dele,
+            'net': add - dele,
             'commits': total_commits,
             'codes': codes_list
         })
@@ -72,46 +104,38 @@ def aggregate_by_year(data: dict) -> list:
     return result
 
 
+# Classe CSS des barres, indexée par le signe du delta (False: négatif, True: positif)
+SIGN_CLASS = ('neg', 'pos')
+
+
 def format_number(n: int) -> str:
     """Formate un nombre avec séparateur de milliers"""
     return f"{n:,}".replace(',', ' ')
 
 
-def generate_html(yearly_data: list, metadata: dict) -> str:
-    """Génère le fichier HTML avec le graphe en block elements"""
-
-    if not yearly_data:
-        return '<html><body>Aucune donnée</body></html>'
+def write_html(out: TextIO, yearly_data: list, metadata: dict) -> None:
+    """Écrit le HTML du graphe en block elements directement dans le flux `out`"""
 
     # Filter out 1970 (artifact from git system start)
     yearly_data = [d for d in yearly_data if d['year'] != 1970]
 
     if not yearly_data:
-        return '<html><body>Aucune donnée</body></html>'
+        out.write('<html><body>Aucune donnée</body></html>')
+        return
 
     # Calculate cumulative values for Kagi-style chart
     # Each year starts where the previous year ended
-    cumulative = 0
-    for d in yearly_data:
-        d['cumul_start'] = cumulative
-        cumulative += d['net']
-        d['cumul_end'] = cumulative
+    # (cumulative[i] is where year i starts, cumulative[i + 1] where it ends)
+    cumulative = list(accumulate((d['net'] for d in yearly_data), initial=0))
 
     # Calculate max for scale based on cumulative range
-    all_values = []
-    for d in yearly_data:
-        all_values.append(d['cumul_start'])
-        all_values.append(d['cumul_end'])
-    max_positive = max(all_values) if all_values else 0
-    max_negative = min(all_values) if all_values else 0
-    max_abs = max(abs(max_positive), abs(max_negative))
+    max_abs = max(max(cumulative), -min(cumulative))
 
     # Chart dimensions - calculated dynamically based on data
     num_years = len(yearly_data)
     target_width = 1400  # Target width in pixels
-    bar_height = 800     # Height in pixels (1px per cell for resolution)
+    bar_height = 800     # Height in pixels (bars are snapped to whole pixels)
     cell_width = max(10, min(30, target_width // num_years)) if num_years > 0 else 25
-    cell_height = 1      # 1px per cell
 
     # Year label frequency - adapt based on number of years and column width
     # Show fewer labels when columns are narrow to avoid overlap
@@ -143,11 +167,11 @@ body {{ font-family: 'JetBrains Mono', monospace; font-size: 14px; line-height:
 .columns {{ display: flex; align-items: flex-end; }}
 .col {{ display: flex; flex-direction: column; width: {cell_width}px; position: relative; }}
 .col:hover {{ opacity: 0.7; }}
-.cell {{ height: {cell_height}px; width: {cell_width}px; }}
+.bar-area {{ position: relative; height: {bar_height}px; }}
+.bar {{ position: absolute; left: 0; width: 100%; }}
 .pos {{ background-color: #cf222e; }}
 .neg {{ background-color: #2ea043; }}
 .year-label {{ font-size: 10px; color: #666; text-align: center; height: 1.5em; line-height: 1.5em; }}
-.info {{ display: none; }}
 .info-header {{ font-weight: bold; margin-bottom: 0.5em; }}
 .info-codes {{ font-size: 12px; color: #444; }}
 .info-codes div {{ padding: 1px 0; display: flex; }}
@@ -155,48 +179,13 @@ body {{ font-family: 'JetBrains Mono', monospace; font-size: 14px; line-height:
 a {{ color: #666; }}
 '''
 
-    html_parts = []
-    html_parts.append('<!DOCTYPE html>')
-    html_parts.append('<html lang="fr">')
-    html_parts.append('<head>')
-    html_parts.append('<meta charset="UTF-8">')
-    html_parts.append('<meta name="viewport" content="width=device-width, initial-scale=1.0">')
-    html_parts.append('<title>Lexflation</title>')
-    html_parts.append(f'<style>{css}</style>')
-    html_parts.append('</head>')
-    html_parts.append('<body>')
-
-    # Header with title and stats
-    net_str = f"+{format_number(total_net)}" if total_net >= 0 else format_number(total_net)
-    html_parts.append('<div class="header">')
-    html_parts.append('<div class="title">Inflation normative</div>')
-    html_parts.append(f'<div class="subtitle">Total: {net_str} lignes | {metadata["total_codes"]} codes | {metadata["total_commits"]} modifications | <a href="https://git.tricoteuses.fr/codes">git.tricoteuses.fr</a></div>')
-    html_parts.append('</div>')
-
-    # Main layout: graph on left, info on right
-    html_parts.append('<div class="main-layout">')
-
-    # Graph section
-    html_parts.append('<div class="graph-section">')
-
-    # Chart container
-    html_parts.append('<div class="chart-container">')
-
-    # Columns - Kagi-style: each column contains year label at top, bars, year label at bottom
-    html_parts.append('<div class="columns">')
-    for idx, year_data in enumerate(yearly_data):
-        year = year_data['year']
-        net = year_data['net']
-        cumul_start = year_data['cumul_start']
-        cumul_end = year_data['cumul_end']
-
-        # Convert cumulative values to cell positions (0 at bottom, bar_height at top)
-        if max_abs == 0:
-            start_pos = 0
-            end_pos = 0
-        else:
-            start_pos = cumul_start / max_abs * bar_height
-            end_pos = cumul_end / max_abs * bar_height
+    # Precompute the filled range of every column once, before emitting bars
+    scale = bar_height / max_abs if max_abs else 0
+    fill_ranges = []
+    for cumul_start, cumul_end in zip(cumulative, cumulative[1:]):
+        # Convert cumulative values to pixel positions (0 at bottom, bar_height at top)
+        start_pos = cumul_start * scale
+        end_pos = cumul_end * scale
 
         # Determine the range to fill (from min to max of start/end)
         fill_min = min(start_pos, end_pos)
@@ -205,88 +194,132 @@ a {{ color: #666; }}
         # Ensure at least 1px height for every year
         if fill_max - fill_min < 1:
             fill_max = fill_min + 1
-
-        # Generate column
-        html_parts.append(f'<div class="col" data-year="{year}">')
-
-        # Year label at top (dynamic interval based on column width)
-        if year % year_label_interval == 0:
-            html_parts.append(f'<div class="year-label">{year}</div>')
-        else:
-            html_parts.append('<div class="year-label"></div>')
-
-        # Bar cells (from top to bottom, position bar_height-1 to 0)
-        # Use background-color for filled cells
-        for i in range(bar_height):
-            cell_pos = bar_height - 1 - i  # Position from bottom (0 at bottom)
-
-            # Cell is filled if its center is within the range
-            cell_center = cell_pos + 0.5
-            if fill_min <= cell_center < fill_max:
-                color_class = "pos" if net >= 0 else "neg"
-                html_parts.append(f'<div class="cell {color_class}"></div>')
-            else:
-                html_parts.append('<div class="cell"></div>')
-
-        # Year label at bottom (dynamic interval based on column width)
-        if year % year_label_interval == 0:
-            html_parts.append(f'<div class="year-label">{year}</div>')
-        else:
-            html_parts.append('<div class="year-label"></div>')
-
-        # Info popup - will be displayed in right column
-        net_str_year = f"+{format_number(net)}" if net >= 0 else format_number(net)
-        color = "#cf222e" if net >= 0 else "#2ea043"
-
-        # Build info with line breaks
-        info_lines = []
-        info_lines.append(f'<div class="info-header" style="color:{color}">{year}: {net_str_year} lignes ({year_data["commits"]} modifications)</div>')
-        info_lines.append('<div class="info-codes">')
+        fill_ranges.append((fill_min, fill_max))
+
+    # Per-year details for the info panel, rendered client-side on hover.
+    # Code names repeat across years: store each once and refer to it by index
+    code_names = []
+    code_name_idx = {}
+    year_info = []
+    for year_data in yearly_data:
+        codes = []
         for code in year_data['codes']:
-            code_net = code['add'] - code['del']
-            code_net_str = f"+{format_number(code_net)}" if code_net >= 0 else format_number(code_net)
-            code_color = "#cf222e" if code_net >= 0 else "#2ea043"
-            info_lines.append(f'<div><span class="code-delta" style="color:{code_color}">{code_net_str}</span><span>{escape(code["name"])}</span></div>')
-        info_lines.append('</div>')
-
-        info_html = f'<div class="info">{"".join(info_lines)}</div>'
-        html_parts.append(info_html)
+            name = code['name']
+            if name not in code_name_idx:
+                code_name_idx[name] = len(code_names)
+                code_names.append(name)
+            codes.append((code_name_idx[name], code['net']))
+        year_info.append((year_data['year'], year_data['net'], year_data['commits'], codes))
 
-        html_parts.append('</div>')  # end col
+    net_str = f"+{format_number(total_net)}" if total_net >= 0 else format_number(total_net)
 
-    html_parts.append('</div>')  # end columns
+    # Static page start up to the columns container, written in one go:
+    # header with title and stats, then main layout (graph on left, info on right)
+    w = out.write
+    w(f'''<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="UTF-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<title>Lexflation</title>
+<style>{css}</style>
+</head>
+<body>
+<div class="header">
+<div class="title">Inflation normative</div>
+<div class="subtitle">Total: {net_str} lignes | {metadata["total_codes"]} codes | {metadata["total_commits"]} modifications | <a href="https://git.tricoteuses.fr/codes">git.tricoteuses.fr</a></div>
+</div>
+<div class="main-layout">
+<div class="graph-section">
+<div class="chart-container">
+<div class="columns">
+''')
 
-    html_parts.append('</div>')  # end chart-container
-    html_parts.append('</div>')  # end graph-section
+    # Columns - Kagi-style: each column contains year label at top, bars, year label at bottom
+    for year_data, (fill_min, fill_max) in zip(yearly_data, fill_ranges):
+        year = year_data['year']
+        net = year_data['net']
+        bar_class = SIGN_CLASS[net >= 0]
 
-    # Info section (right side) - container for tooltip display
-    html_parts.append('<div class="info-section" id="info-display"></div>')
+        # Year label (dynamic interval based on column width), shown at top and bottom
+        if year % year_label_interval == 0:
+            year_label = f'<div class="year-label">{year}</div>\n'
+        else:
+            year_label = '<div class="year-label"></div>\n'
 
-    html_parts.append('</div>')  # end main-layout
+        # Bar as a single block positioned in the column's bar area.
+        # A pixel row is filled if its center (pos + 0.5) is within the range, so the
+        # filled rows are the contiguous positions [fill_lo, fill_hi), 0 at bottom
+        fill_lo = min(max(math.ceil(fill_min - 0.5), 0), bar_height)
+        fill_hi = min(max(math.ceil(fill_max - 0.5), fill_lo), bar_height)
+        bar = f'<div class="bar {bar_class}" style="top:{bar_height - fill_hi}px;height:{fill_hi - fill_lo}px"></div>'
 
-    # JavaScript to display info in right column on hover
+        # Generate column
+        w(f'<div class="col" data-year="{year}">\n{year_label}<div class="bar-area">{bar}</div>\n{year_label}</div>\n')
+
+    # End of columns, chart-container and graph-section, then the info section
+    # (right side, container for tooltip display) and end of main-layout
+    w('''</div>
+</div>
+</div>
+<div class="info-section" id="info-display"></div>
+</div>
+''')
+
+    # Info data as JSON ('</' escaped so it cannot close the script element)
+    info_json = json.dumps({'names': code_names, 'years': year_info}, ensure_ascii=False, separators=(',', ':'))
+    info_json = info_json.replace('</', '<\\/')
+    w(f'<script type="application/json" id="year-info">{info_json}</script>\n')
+
+    # JavaScript to render the info of the hovered year in the right column
     js_code = '''
 <script>
-document.querySelectorAll('.col').forEach(col => {
-    const info = col.querySelector('.info');
-    const display = document.getElementById('info-display');
-    if (info && display) {
-        col.addEventListener('mouseenter', () => {
-            display.innerHTML = info.innerHTML;
-        });
-        col.addEventListener('mouseleave', () => {
-            display.innerHTML = '';
-        });
+const YEAR_INFO = JSON.parse(document.getElementById('year-info').textContent);
+const display = document.getElementById('info-display');
+const formatDelta = n => (n >= 0 ? '+' : '-') + String(Math.abs(n)).replace(/\\B(?=(\\d{3})+(?!\\d))/g, ' ');
+const deltaColor = n => n >= 0 ? '#cf222e' : '#2ea043';
+
+function renderInfo([year, net, commits, codes]) {
+    const header = document.createElement('div');
+    header.className = 'info-header';
+    header.style.color = deltaColor(net);
+    header.textContent = `${year}: ${formatDelta(net)} lignes (${commits} modifications)`;
+
+    const list = document.createElement('div');
+    list.className = 'info-codes';
+    for (const [nameIdx, codeNet] of codes) {
+        const delta = document.createElement('span');
+        delta.className = 'code-delta';
+        delta.style.color = deltaColor(codeNet);
+        delta.textContent = formatDelta(codeNet);
+        const name = document.createElement('span');
+        name.textContent = YEAR_INFO.names[nameIdx];
+        const row = document.createElement('div');
+        row.append(delta, name);
+        list.append(row);
+    }
+    display.replaceChildren(header, list);
+}
+
+// A single delegated handler for all columns, keyed by their data-year
+const infoByYear = new Map(YEAR_INFO.years.map(info => [String(info[0]), info]));
+const columns = document.querySelector('.columns');
+let currentCol = null;
+columns.addEventListener('mouseover', event => {
+    const col = event.target.closest('.col');
+    if (col && col !== currentCol) {
+        currentCol = col;
+        renderInfo(infoByYear.get(col.dataset.year));
     }
 });
+columns.addEventListener('mouseleave', () => {
+    currentCol = null;
+    display.replaceChildren();
+});
 </script>
 '''
-    html_parts.append(js_code)
-
-    html_parts.append('</body>')
-    html_parts.append('</html>')
-
-    return '\n'.join(html_parts)
+    w(js_code)
+    w('\n</body>\n</html>\n')
 
 
 def main():
@@ -309,9 +342,9 @@ def main():
 
     # Générer le HTML
     print("Génération du HTML...")
-    html = generate_html(yearly_data, data['metadata'])
-    with open(html_file, 'w', encoding='utf-8') as f:
-        f.write(html)
+    # Écrire au fil de l'eau plutôt que de construire la page entière en mémoire
+    with open(html_file, 'w', encoding='utf-8', buffering=1 << 20) as f:
+        write_html(f, yearly_data, data['metadata'])
     print(f"  -> {html_file.name}: {html_file.stat().st_size / 1024:.1f} Ko")
 
     print("Terminé!")